@@ -1,5 +1,14 @@
+import bisect
+import concurrent.futures
+import csv
+import gzip
+import io
+import hashlib
 import json
 import math
+import os
+import re
+import tempfile
 import psycopg2
 import psycopg2.extras
 
@@ -24,112 +33,381 @@ def load_data(table_name, file_path, connection, header_path):
     cursor.close()
 
 
-def range_partition(data_table_name, partition_table_prefix, num_partitions, header_path, column_to_partition, connection):
-    cursor = connection.cursor()
+def _checkpoint_exists(cursor, partition_table_prefix):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{partition_table_prefix}_checkpoint",))
+    return cursor.fetchone()[0]
 
-    with open(header_path, 'r') as f:
-        headers = json.load(f)
 
-    columns = ', '.join(f"{col} {dtype}" for col, dtype in headers.items())
+def _create_checkpoint(cursor, data_table_name, partition_table_prefix, num_partitions, batch_size,
+                       column_to_partition=None, bounds=None):
+    """Record a new checkpointed build and return its state.
 
-    cursor.execute(f"DROP TABLE IF EXISTS {partition_table_prefix} CASCADE")
-    cursor.execute(f"CREATE TABLE {partition_table_prefix} ({columns}) PARTITION BY RANGE ({column_to_partition})")
+    Batches are ranges of heap pages of the source, so resuming needs neither an
+    index nor a unique key and every row (duplicate or NULL ids included) is copied
+    exactly once. batch_size rows are turned into a page count using the planner's
+    rows per page.
+    """
+    cursor.execute("""
+        SELECT reltuples, relpages, pg_relation_size(oid) / current_setting('block_size')::int
+        FROM pg_class WHERE oid = %s::regclass
+    """, (data_table_name,))
+    reltuples, relpages, total_pages = cursor.fetchone()
+    rows_per_page = reltuples / relpages if reltuples > 0 and relpages > 0 else 50
+    batch_pages = max(1, int(batch_size / rows_per_page))
 
-    cursor.execute(f"SELECT MIN({column_to_partition}), MAX({column_to_partition}) FROM {data_table_name}")
-    min_val, max_val = cursor.fetchone()
-    interval = math.ceil((max_val - min_val + 1) / num_partitions)
+    cursor.execute(f"DROP TABLE IF EXISTS {partition_table_prefix}_checkpoint")
+    cursor.execute(f"""
+        CREATE TABLE {partition_table_prefix}_checkpoint (
+            num_partitions INTEGER NOT NULL,
+            column_name TEXT,
+            bounds TEXT,
+            total_pages BIGINT NOT NULL,
+            batch_pages INTEGER NOT NULL,
+            next_page BIGINT NOT NULL DEFAULT 0,
+            rows_copied BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute(f"""
+        INSERT INTO {partition_table_prefix}_checkpoint (num_partitions, column_name, bounds, total_pages, batch_pages)
+        VALUES (%s, %s, %s, %s, %s)
+    """, (num_partitions, column_to_partition, json.dumps(bounds) if bounds else None, total_pages, batch_pages))
+    return _read_checkpoint(cursor, partition_table_prefix, num_partitions, column_to_partition)
 
-    for i in range(num_partitions):
-        start = min_val + i * interval
-        end = start + interval
-        part_table_name = f"{partition_table_prefix}{i}"
+
+def _read_checkpoint(cursor, partition_table_prefix, num_partitions, column_to_partition=None):
+    cursor.execute(f"""
+        SELECT num_partitions, column_name, bounds, total_pages, batch_pages, next_page, rows_copied
+        FROM {partition_table_prefix}_checkpoint
+    """)
+    saved_partitions, column_name, bounds, total_pages, batch_pages, next_page, rows_copied = cursor.fetchone()
+    if saved_partitions != num_partitions or column_name != column_to_partition:
+        raise Exception(
+            f"Checkpoint of {partition_table_prefix} is for {saved_partitions} partition(s) on {column_name}, "
+            f"not {num_partitions} on {column_to_partition}; rebuild without resume"
+        )
+    return {
+        "bounds": [tuple(b) for b in json.loads(bounds)] if bounds else None,
+        "total_pages": total_pages,
+        "batch_pages": batch_pages,
+        "next_page": next_page,
+        "rows_copied": rows_copied,
+    }
+
+
+def _range_bounds(cursor, partition_table_prefix):
+    """Return the (start, end) bounds of <prefix>0, <prefix>1, ... as attached to the parent"""
+    cursor.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (partition_table_prefix,))
+    children = dict(cursor.fetchall())
+    bounds = []
+    for i in range(len(children)):
+        match = re.search(r"FROM \((.+?)\) TO \((.+?)\)", children.get(f"{partition_table_prefix}{i}") or "")
+        if not match:
+            raise Exception(f"{partition_table_prefix}{i} is not a range partition of {partition_table_prefix}")
+        bounds.append((int(match.group(1)), int(match.group(2))))
+    return bounds
+
+
+def _checkpointed_copy(cursor, connection, partition_table_prefix, state, copy_sql):
+    """Copy the source one committed batch of heap pages at a time.
+
+    copy_sql(where, rows_copied) returns the WITH list of data-modifying CTEs that
+    copy the rows matching where, ending in a CTE named copied with one row per row
+    copied. The checkpoint update rides in the same statement, so a batch and its
+    progress commit together even on an autocommit connection. Returns the total
+    number of rows copied.
+    """
+    next_page, rows_copied = state["next_page"], state["rows_copied"]
+    while next_page < state["total_pages"]:
+        end_page = min(next_page + state["batch_pages"], state["total_pages"])
+        # Read as a TID range scan, only the pages of this batch are visited
+        where = f"ctid >= '({next_page},0)'::tid AND ctid < '({end_page},0)'::tid"
         cursor.execute(f"""
-            CREATE TABLE {part_table_name} PARTITION OF {partition_table_prefix}
-            FOR VALUES FROM ({start}) TO ({end})
+            WITH {copy_sql(where, rows_copied)}, progress AS (
+                UPDATE {partition_table_prefix}_checkpoint
+                SET next_page = {end_page}, rows_copied = rows_copied + (SELECT COUNT(*) FROM copied)
+            )
+            SELECT COUNT(*) FROM copied
         """)
+        rows_copied += cursor.fetchone()[0]
+        next_page = end_page
+        connection.commit()
+    return rows_copied
 
-    cursor.execute(f"INSERT INTO {partition_table_prefix} SELECT * FROM {data_table_name}")
-    connection.commit()
-    cursor.close()
 
+def range_partition(data_table_name, partition_table_prefix, num_partitions, header_path, column_to_partition, connection,
+                    batch_size=None, resume=False):
+    """Create range partitioned table.
 
-def round_robin_partition(data_table_name, partition_table_name, num_partitions, header_file, connection):
-    """Create round-robin partitioned table with minimal output"""
+    By default all rows are copied in one transaction. With batch_size the copy runs
+    in committed batches that record progress in <prefix>_checkpoint, and resume=True
+    continues such a build from its last checkpoint, with the bounds it was started
+    with, instead of starting over.
+    """
     cursor = connection.cursor()
-    
-    try:
-        with open(header_file) as f:
-            header_dict = json.load(f)
-        columns = ", ".join(f"{k} {v}" for k, v in header_dict.items())
 
-        cursor.execute(f"DROP TABLE IF EXISTS {partition_table_name} CASCADE")
-        cursor.execute(f"DROP SEQUENCE IF EXISTS {partition_table_name}_insert_seq")
-        connection.commit()
+    resuming = resume and _checkpoint_exists(cursor, partition_table_prefix)
+    if resuming:
+        state = _read_checkpoint(cursor, partition_table_prefix, num_partitions, column_to_partition)
+        built = _range_bounds(cursor, partition_table_prefix)
+        if built != state["bounds"]:
+            raise Exception(
+                f"Partitions of {partition_table_prefix} have bounds {built} but the checkpoint was started "
+                f"with {state['bounds']}; rebuild without resume"
+            )
+    else:
+        with open(header_path, 'r') as f:
+            headers = json.load(f)
 
-        cursor.execute(f"CREATE TABLE {partition_table_name} ({columns})")
-        connection.commit()
+        columns = ', '.join(f"{col} {dtype}" for col, dtype in headers.items())
 
+        cursor.execute(f"DROP TABLE IF EXISTS {partition_table_prefix}_checkpoint")
+        cursor.execute(f"DROP TABLE IF EXISTS {partition_table_prefix} CASCADE")
+        cursor.execute(f"CREATE TABLE {partition_table_prefix} ({columns}) PARTITION BY RANGE ({column_to_partition})")
+
+        cursor.execute(f"SELECT MIN({column_to_partition}), MAX({column_to_partition}) FROM {data_table_name}")
+        min_val, max_val = cursor.fetchone()
+        interval = math.ceil((max_val - min_val + 1) / num_partitions)
+
+        bounds = []
         for i in range(num_partitions):
+            start = min_val + i * interval
+            end = start + interval
+            bounds.append((start, end))
+            part_table_name = f"{partition_table_prefix}{i}"
             cursor.execute(f"""
-                CREATE TABLE {partition_table_name}{i} (
-                    {columns}
-                ) INHERITS ({partition_table_name});
+                CREATE TABLE {part_table_name} PARTITION OF {partition_table_prefix}
+                FOR VALUES FROM ({start}) TO ({end})
             """)
-        connection.commit()
 
-        cursor.execute(f"CREATE SEQUENCE {partition_table_name}_insert_seq")
-        connection.commit()
+        if batch_size is None:
+            cursor.execute(f"INSERT INTO {partition_table_prefix} SELECT * FROM {data_table_name}")
+            connection.commit()
+            cursor.close()
+            return
 
-        trigger_func = f"""
-        CREATE OR REPLACE FUNCTION {partition_table_name}_insert_trigger()
-        RETURNS TRIGGER AS $$
-        DECLARE
-            part_num INTEGER;
-        BEGIN
-            part_num := nextval('{partition_table_name}_insert_seq') % {num_partitions};
-            EXECUTE format('INSERT INTO {partition_table_name}%s VALUES ($1.*)', part_num)
-            USING NEW;
-            RETURN NULL;
-        END;
-        $$ LANGUAGE plpgsql;
-        """
-        cursor.execute(trigger_func)
+        state = _create_checkpoint(cursor, data_table_name, partition_table_prefix, num_partitions, batch_size,
+                                   column_to_partition, bounds)
         connection.commit()
 
-        cursor.execute(f"""
-            CREATE TRIGGER {partition_table_name}_trigger
-            BEFORE INSERT ON {partition_table_name}
-            FOR EACH ROW EXECUTE FUNCTION {partition_table_name}_insert_trigger();
-        """)
+    # One walk over the source; the parent routes every row to its child
+    def copy_sql(where, rows_copied):
+        return f"""copied AS (
+            INSERT INTO {partition_table_prefix} SELECT * FROM {data_table_name} WHERE {where} RETURNING 1
+        )"""
+
+    try:
+        _checkpointed_copy(cursor, connection, partition_table_prefix, state, copy_sql)
+        cursor.execute(f"DROP TABLE {partition_table_prefix}_checkpoint")
         connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
 
-        cursor.execute(f"SELECT COUNT(*) FROM {data_table_name}")
-        total_rows = cursor.fetchone()[0]
-        base_count = total_rows // num_partitions
-        remainder = total_rows % num_partitions
 
-        partition_counts = [base_count + 1 if i < remainder else base_count for i in range(num_partitions)]
+def _copy_text_value(value):
+    """Escape one server-rendered ::text value for COPY text format"""
+    if value is None:
+        return "\\N"
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
 
-        cursor.execute(f"SELECT * FROM {data_table_name} ORDER BY id")
-        rows = cursor.fetchall()
 
-        current_partition = 0
-        rows_in_partition = 0
+def _stream_round_robin(connection, cursor, data_table_name, partition_table_name, num_partitions,
+                        order_by, fetch_size, flush_rows):
+    """Deal rows to the children through a server-side cursor and per-child COPY buffers.
 
-        for i, row in enumerate(rows):
-            placeholders = ", ".join(["%s"] * len(row))
-            cursor.execute(
-                f"INSERT INTO {partition_table_name}{current_partition} VALUES ({placeholders})",
-                row
-            )
-            rows_in_partition += 1
-            if rows_in_partition >= partition_counts[current_partition]:
-                current_partition += 1
-                rows_in_partition = 0
+    Must run inside a transaction block (round_robin_partition takes care of that),
+    so the named cursor streams without being materialized first. Every column is
+    read as ::text, i.e. already in the server's input format, so only the COPY
+    escaping happens here. Client memory stays at one fetched batch plus
+    num_partitions buffers of at most flush_rows rows, whatever the table size.
+    Returns the number of rows copied.
+    """
+    if order_by == "id":
+        order = "ORDER BY id"
+    elif order_by == "ctid":
+        # A plain sequential scan already returns physical order; only keep it from
+        # joining a synchronized scan that started in the middle of the table.
+        # SET LOCAL ends with the build transaction, whether it commits or not
+        cursor.execute("SET LOCAL synchronize_seqscans = off")
+        order = ""
+    elif order_by is None:
+        order = ""
+    else:
+        raise ValueError(f"Unknown order_by: {order_by}")
+
+    cursor.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (data_table_name,))
+    columns = ", ".join(f"{row[0]}::text" for row in cursor.fetchall())
+
+    buffers = [io.StringIO() for _ in range(num_partitions)]
+    buffered = [0] * num_partitions
+
+    def flush(i):
+        buffers[i].seek(0)
+        cursor.copy_expert(f"COPY {partition_table_name}{i} FROM STDIN", buffers[i])
+        buffers[i] = io.StringIO()
+        buffered[i] = 0
+
+    reader = connection.cursor(name=f"{partition_table_name}_stream")
+    reader.itersize = fetch_size
+    reader.execute(f"SELECT {columns} FROM {data_table_name} {order}")
+
+    position = 0
+    while True:
+        rows = reader.fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            i = position % num_partitions
+            buffers[i].write("\t".join(_copy_text_value(v) for v in row) + "\n")
+            buffered[i] += 1
+            position += 1
+            if buffered[i] >= flush_rows:
+                flush(i)
+    reader.close()
+
+    for i in range(num_partitions):
+        if buffered[i]:
+            flush(i)
+    return position
+
+
+def round_robin_partition(data_table_name, partition_table_name, num_partitions, header_file, connection,
+                          batch_size=None, resume=False, stream=False, order_by="id", fetch_size=10000,
+                          flush_rows=10000):
+    """Create round-robin partitioned table with minimal output
+
+    batch_size and resume work as for range_partition. A checkpointed build deals
+    rows to the children in physical order (row n to child n % num_partitions), which
+    gives the same per-child counts as the default build.
+
+    stream=True reads the source through a server-side cursor in batches of fetch_size
+    and deals row n to child n % num_partitions, flushing each child's buffer with COPY
+    every flush_rows rows. order_by is "id", "ctid" (physical order, no sort) or None.
+    """
+    if stream and (batch_size is not None or resume):
+        raise ValueError("stream cannot be combined with batch_size or resume")
+    if stream and order_by not in ("id", "ctid", None):
+        raise ValueError(f"Unknown order_by: {order_by}")
 
-            if i % 10000 == 0:
+    # A streamed build runs as one explicit transaction, also on an autocommit
+    # connection, so a failure rolls the copied rows back
+    restore_autocommit = stream and connection.autocommit
+    if restore_autocommit:
+        connection.autocommit = False
+
+    cursor = connection.cursor()
+    
+    try:
+        resuming = resume and _checkpoint_exists(cursor, partition_table_name)
+        if resuming:
+            state = _read_checkpoint(cursor, partition_table_name, num_partitions)
+        else:
+            with open(header_file) as f:
+                header_dict = json.load(f)
+            columns = ", ".join(f"{k} {v}" for k, v in header_dict.items())
+
+            cursor.execute(f"DROP TABLE IF EXISTS {partition_table_name}_checkpoint")
+            cursor.execute(f"DROP TABLE IF EXISTS {partition_table_name} CASCADE")
+            cursor.execute(f"DROP SEQUENCE IF EXISTS {partition_table_name}_insert_seq")
+            connection.commit()
+
+            cursor.execute(f"CREATE TABLE {partition_table_name} ({columns})")
+            connection.commit()
+
+            for i in range(num_partitions):
+                cursor.execute(f"""
+                    CREATE TABLE {partition_table_name}{i} (
+                        {columns}
+                    ) INHERITS ({partition_table_name});
+                """)
+            connection.commit()
+
+            cursor.execute(f"CREATE SEQUENCE {partition_table_name}_insert_seq MINVALUE 0")
+            connection.commit()
+
+            trigger_func = f"""
+            CREATE OR REPLACE FUNCTION {partition_table_name}_insert_trigger()
+            RETURNS TRIGGER AS $$
+            DECLARE
+                part_num INTEGER;
+            BEGIN
+                part_num := nextval('{partition_table_name}_insert_seq') % {num_partitions};
+                EXECUTE format('INSERT INTO {partition_table_name}%s VALUES ($1.*)', part_num)
+                USING NEW;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """
+            cursor.execute(trigger_func)
+            connection.commit()
+
+            cursor.execute(f"""
+                CREATE TRIGGER {partition_table_name}_trigger
+                BEFORE INSERT ON {partition_table_name}
+                FOR EACH ROW EXECUTE FUNCTION {partition_table_name}_insert_trigger();
+            """)
+            connection.commit()
+
+        if stream:
+            total_rows = _stream_round_robin(connection, cursor, data_table_name, partition_table_name,
+                                             num_partitions, order_by, fetch_size, flush_rows)
+        elif batch_size is not None or resuming:
+            if not resuming:
+                state = _create_checkpoint(cursor, data_table_name, partition_table_name, num_partitions, batch_size)
                 connection.commit()
 
+            def copy_sql(where, rows_copied):
+                inserts = "".join(
+                    f", copied{i} AS (INSERT INTO {partition_table_name}{i} SELECT (r).* FROM batch WHERE part = {i})"
+                    for i in range(num_partitions)
+                )
+                return f"""batch AS MATERIALIZED (
+                    SELECT r, (row_number() OVER () - 1 + {rows_copied}) % {num_partitions} AS part
+                    FROM {data_table_name} AS r WHERE {where}
+                ){inserts}, copied AS (SELECT 1 FROM batch)"""
+
+            total_rows = _checkpointed_copy(cursor, connection, partition_table_name, state, copy_sql)
+            # Dropped together with the sequence restart so a finished build never looks resumable
+            cursor.execute(f"DROP TABLE {partition_table_name}_checkpoint")
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM {data_table_name}")
+            total_rows = cursor.fetchone()[0]
+            base_count = total_rows // num_partitions
+            remainder = total_rows % num_partitions
+
+            partition_counts = [base_count + 1 if i < remainder else base_count for i in range(num_partitions)]
+
+            cursor.execute(f"SELECT * FROM {data_table_name} ORDER BY id")
+            rows = cursor.fetchall()
+
+            current_partition = 0
+            rows_in_partition = 0
+
+            for i, row in enumerate(rows):
+                placeholders = ", ".join(["%s"] * len(row))
+                cursor.execute(
+                    f"INSERT INTO {partition_table_name}{current_partition} VALUES ({placeholders})",
+                    row
+                )
+                rows_in_partition += 1
+                if rows_in_partition >= partition_counts[current_partition]:
+                    current_partition += 1
+                    rows_in_partition = 0
+
+                if i % 10000 == 0:
+                    connection.commit()
+
         cursor.execute(f"""
             ALTER SEQUENCE {partition_table_name}_insert_seq 
             RESTART WITH {total_rows % num_partitions}
@@ -142,6 +420,774 @@ def round_robin_partition(data_table_name, partition_table_name, num_partitions,
         raise
     finally:
         cursor.close()
+        if restore_autocommit:
+            connection.autocommit = True
+
+
+def _parse_pg_array(text):
+    if not text:
+        return []
+    return [float(v) for v in text.strip("{}").split(",") if v not in ("", "NULL")]
+
+
+def _histogram_below(bounds, x):
+    """Share of an equi-depth histogram (sorted bounds) that lies below x"""
+    if len(bounds) < 2 or x <= bounds[0]:
+        return 0.0
+    if x > bounds[-1]:
+        return 1.0
+    # bounds[j] < x <= bounds[j + 1], so the bucket has a non-zero width
+    j = bisect.bisect_left(bounds, x) - 1
+    return (j + (x - bounds[j]) / (bounds[j + 1] - bounds[j])) / (len(bounds) - 1)
+
+
+def plan_partitions(data_table_name, column_to_partition, strategy, num_partitions, connection,
+                    target_partition_bytes=None, sample_percent=1.0, max_partitions=1024):
+    """Estimate a partition layout without building it.
+
+    Row counts come from reltuples and the pg_stats histogram / most common values of
+    the column, row width from pg_relation_size / reltuples. A TABLESAMPLE SYSTEM
+    sample stands in for both when the table has not been analyzed yet; tables too
+    small for sample_percent to hit a handful of pages are read in full instead.
+    Range boundaries are computed the same way range_partition computes them.
+
+    Returns a dict with the predicted boundaries (range only), per-partition rows and
+    bytes, the skew (largest partition over the mean) and, when target_partition_bytes
+    is given, the smallest number of partitions (up to max_partitions) whose largest
+    predicted partition fits the target, or None if there is none.
+    """
+    if strategy not in ("range", "round_robin"):
+        raise ValueError(f"Unknown partitioning strategy: {strategy}")
+    if not isinstance(num_partitions, int) or num_partitions <= 0:
+        raise ValueError(f"num_partitions must be a positive integer, got {num_partitions}")
+
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+            SELECT reltuples, pg_relation_size(oid), pg_relation_size(oid) / current_setting('block_size')::int
+            FROM pg_class WHERE oid = %s::regclass
+        """, (data_table_name,))
+        reltuples, table_bytes, pages = cursor.fetchone()
+
+        stats = None
+        if strategy == "range":
+            cursor.execute("""
+                SELECT null_frac, histogram_bounds::text, most_common_vals::text, most_common_freqs
+                FROM pg_stats
+                WHERE schemaname = current_schema() AND tablename = %s AND attname = %s
+            """, (data_table_name, column_to_partition))
+            stats = cursor.fetchone()
+
+        # reltuples is -1 (or 0 on older servers) until the table is vacuumed or analyzed
+        keys = []
+        if reltuples > 0:
+            total_rows = reltuples
+        else:
+            percent = sample_percent if pages * sample_percent / 100 >= 10 else 100.0
+            cursor.execute(
+                f"SELECT {column_to_partition if strategy == 'range' else 'NULL'} FROM {data_table_name} TABLESAMPLE SYSTEM (%s)",
+                (percent,)
+            )
+            sample = cursor.fetchall()
+            total_rows = len(sample) * 100.0 / percent
+            keys = [row[0] for row in sample if row[0] is not None]
+        row_bytes = table_bytes / total_rows if total_rows else 0.0
+
+        if stats:
+            null_frac, histogram, mcv_text, mcv_freqs = stats
+            histogram = _parse_pg_array(histogram)
+            mcvs = list(zip(_parse_pg_array(mcv_text), mcv_freqs or []))
+            known = histogram + [v for v, _ in mcvs]
+        elif strategy == "range" and not keys:
+            # Analyzed but without column statistics: fall back to sampling the keys
+            percent = sample_percent if pages * sample_percent / 100 >= 10 else 100.0
+            cursor.execute(
+                f"SELECT {column_to_partition} FROM {data_table_name} TABLESAMPLE SYSTEM (%s) WHERE {column_to_partition} IS NOT NULL",
+                (percent,)
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+            known = keys
+        else:
+            known = keys
+        if strategy == "range" and not known:
+            raise Exception(f"No statistics or sampled rows for {data_table_name}.{column_to_partition}")
+
+        # Cumulative distribution of the key, built once so every bound is a bisect
+        if stats:
+            histogram.sort()
+            mcvs.sort()
+            mcv_values = [v for v, _ in mcvs]
+            mcv_cumulative = [0.0]
+            for _, f in mcvs:
+                mcv_cumulative.append(mcv_cumulative[-1] + f)
+            histogram_share = 1.0 - null_frac - mcv_cumulative[-1]
+
+            def below(x):
+                return (histogram_share * _histogram_below(histogram, x)
+                        + mcv_cumulative[bisect.bisect_left(mcv_values, x)])
+        elif strategy == "range":
+            keys.sort()
+
+            def below(x):
+                return bisect.bisect_left(keys, x) / len(keys)
+
+        def estimate(n):
+            if strategy == "round_robin":
+                base_count, remainder = divmod(int(round(total_rows)), n)
+                return None, [base_count + 1 if i < remainder else base_count for i in range(n)]
+
+            min_val, max_val = int(min(known)), int(max(known))
+            interval = math.ceil((max_val - min_val + 1) / n)
+            boundaries = [(min_val + i * interval, min_val + (i + 1) * interval) for i in range(n)]
+            cumulative = [below(start) for start, _ in boundaries] + [below(boundaries[-1][1])]
+            rows = [int(round(total_rows * (b - a))) for a, b in zip(cumulative, cumulative[1:])]
+            return boundaries, rows
+
+        boundaries, rows = estimate(num_partitions)
+        mean = sum(rows) / num_partitions
+        plan = {
+            "strategy": strategy,
+            "partitions": num_partitions,
+            "boundaries": boundaries,
+            "rows": rows,
+            "bytes": [int(r * row_bytes) for r in rows],
+            "skew": max(rows) / mean if mean else 0.0,
+            "recommended_partitions": None,
+        }
+        if target_partition_bytes:
+            # Skewed keys can leave the largest range partition over the target even
+            # when the average fits, so look for the smallest N whose largest one fits:
+            # double from the average-based guess, then bisect the last step
+            def fits(n):
+                return max(estimate(n)[1]) * row_bytes <= target_partition_bytes
+
+            low = max(1, math.ceil(total_rows * row_bytes / target_partition_bytes))
+            if low <= max_partitions:
+                high = low
+                while high < max_partitions and not fits(high):
+                    low = high + 1
+                    high = min(high * 2, max_partitions)
+                if fits(high):
+                    while low < high:
+                        middle = (low + high) // 2
+                        if fits(middle):
+                            high = middle
+                        else:
+                            low = middle + 1
+                    plan["recommended_partitions"] = high
+        return plan
+    finally:
+        cursor.close()
+
+
+class _HashingWriter:
+    """File wrapper that counts and hashes every byte written through it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.size += len(data)
+        self.sha256.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def _export_partition(dsn, snapshot, table_name, path, file_format, compression, level):
+    connection = psycopg2.connect(dsn)
+    try:
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = connection.cursor()
+        if snapshot:
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+
+        with open(path, 'wb') as f:
+            hashed = _HashingWriter(f)
+            if compression == "gzip":
+                with gzip.GzipFile(fileobj=hashed, mode='wb', compresslevel=6 if level is None else level) as out:
+                    cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT {file_format})", out)
+            elif compression == "zstd":
+                import zstandard
+                with zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(hashed, closefd=False) as out:
+                    cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT {file_format})", out)
+            else:
+                cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT {file_format})", hashed)
+        rows = cursor.rowcount
+
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    return {
+        "table": table_name,
+        "file": os.path.basename(path),
+        "rows": rows,
+        "bytes": hashed.size,
+        "sha256": hashed.sha256.hexdigest(),
+    }
+
+
+def export_partitions(partition_table_prefix, out_dir, dsn, format="csv", workers=4, compression=None, level=None):
+    """Export every child of a partitioned table to its own file.
+
+    Each child is streamed with COPY ... TO STDOUT over its own connection, up to
+    workers at a time, into out_dir/<child>.<format>[.gz|.zst]. All workers read the
+    same exported snapshot, so the files are consistent with each other. zstd needs
+    the zstandard package. A manifest.json with the row count, size and sha256 of
+    every file is written last.
+
+    Returns the manifest.
+    """
+    if format not in ("csv", "binary"):
+        raise ValueError(f"Unknown export format: {format}")
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd":
+        import zstandard  # noqa: F401  fail before any worker starts
+
+    os.makedirs(out_dir, exist_ok=True)
+    extension = format + {None: "", "gzip": ".gz", "zstd": ".zst"}[compression]
+
+    connection = psycopg2.connect(dsn)
+    try:
+        connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT c.relname
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+        """, (partition_table_prefix,))
+        tables = [row[0] for row in cursor.fetchall()]
+        if not tables:
+            raise Exception(f"Could not find partitions of {partition_table_prefix}")
+
+        # Held open until every worker has imported it
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot = cursor.fetchone()[0]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [
+                pool.submit(_export_partition, dsn, snapshot, table, os.path.join(out_dir, f"{table}.{extension}"),
+                            format, compression, level)
+                for table in tables
+            ]
+            entries = [future.result() for future in futures]
+
+        connection.commit()
+        cursor.close()
+    finally:
+        connection.close()
+
+    manifest = {
+        "prefix": partition_table_prefix,
+        "format": format,
+        "compression": compression,
+        "partitions": entries,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest
+
+
+class GroupCommitError(Exception):
+    """A commit group was rolled back; rows holds every row of the group, in insert order"""
+
+    def __init__(self, message, rows):
+        super().__init__(message)
+        self.rows = rows
+
+
+def _cast_key(value, dtype):
+    """Convert a partition key read from CSV or JSON to the column's Python type"""
+    if value is None or not isinstance(value, str):
+        return value
+    dtype = dtype.upper()
+    if "INT" in dtype or dtype in ("SERIAL", "BIGSERIAL"):
+        return int(value)
+    if dtype in ("REAL", "FLOAT", "DOUBLE PRECISION") or dtype.startswith("NUMERIC") or dtype.startswith("DECIMAL"):
+        return float(value)
+    return value
+
+
+class PartitionInserter:
+    """Long-lived single-row inserter that routes rows to child tables in memory.
+
+    One INSERT plan per child table is PREPAREd up front. Range rows are routed
+    with the cached partition bounds, round-robin rows with a locally reserved
+    block of values from <prefix>_insert_seq, so each insert is a single
+    EXECUTE against the owning child and never goes through the parent trigger.
+
+    The inserter switches the connection to autocommit and owns it from then on.
+    With commit_every=1 every row is committed by the server on its own; with a
+    larger value BEGIN and COMMIT ride along with the first and last EXECUTE of
+    each group, so a row still costs one round trip. A row is only durable once its
+    group commits; if any statement of a group fails the whole group is rolled back
+    and GroupCommitError hands back its rows so the caller can retry them.
+    """
+
+    def __init__(self, partition_table_prefix, header_path, connection, strategy="range",
+                 column_to_partition=None, commit_every=1, block_size=1000):
+        if strategy not in ("range", "round_robin"):
+            raise ValueError(f"Unknown partitioning strategy: {strategy}")
+        if strategy == "range" and column_to_partition is None:
+            raise ValueError("column_to_partition is required for range inserts")
+
+        with open(header_path, 'r') as f:
+            self.headers = json.load(f)
+
+        self.prefix = partition_table_prefix
+        self.connection = connection
+        self.strategy = strategy
+        self.commit_every = max(1, commit_every)
+        self.block_size = max(1, block_size)
+
+        self.columns = list(self.headers)
+        self.partition_index = self.columns.index(column_to_partition) if column_to_partition else None
+        self.group = []
+        self.reserved = []
+
+        self.connection.autocommit = True
+        self.cursor = self.connection.cursor()
+
+        self.partitions = self._load_partitions()
+        self.statements = [f"{self.prefix}{i}_insert" for i in range(len(self.partitions))]
+        self._prepare()
+
+    def _load_partitions(self):
+        self.cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+        """, (self.prefix,))
+        children = dict(self.cursor.fetchall())
+        partitions = [f"{self.prefix}{i}" for i in range(len(children))]
+        missing = [name for name in partitions if name not in children]
+        if not children or missing:
+            raise Exception(f"Could not find partitions of {self.prefix}: {missing or 'none created'}")
+
+        if self.strategy == "range":
+            self.lower_bounds = []
+            self.upper_bounds = []
+            for name in partitions:
+                match = re.search(r"FROM \((.+?)\) TO \((.+?)\)", children[name] or "")
+                if not match:
+                    raise Exception(f"{name} is not a range partition of {self.prefix}")
+                self.lower_bounds.append(int(match.group(1)))
+                self.upper_bounds.append(int(match.group(2)))
+
+        return partitions
+
+    def _prepare(self):
+        types = ", ".join(self.headers.values())
+        placeholders = ", ".join(f"${i + 1}" for i in range(len(self.columns)))
+        for name, statement in zip(self.partitions, self.statements):
+            self.cursor.execute(f"PREPARE {statement} ({types}) AS INSERT INTO {name} VALUES ({placeholders})")
+
+    def _reserve(self):
+        # Values are drawn exactly as the trigger would draw them, so rows written
+        # here and rows written through the parent share one round-robin order
+        self.cursor.execute(
+            f"SELECT nextval('{self.prefix}_insert_seq') FROM generate_series(1, {self.block_size})"
+        )
+        self.reserved = [row[0] for row in self.cursor.fetchall()]
+        self.reserved.reverse()
+
+    def route(self, values):
+        """Return the index of the child table that owns a row"""
+        if self.strategy == "round_robin":
+            if not self.reserved:
+                self._reserve()
+            return self.reserved.pop() % len(self.partitions)
+
+        key = _cast_key(values[self.partition_index], self.headers[self.columns[self.partition_index]])
+        i = bisect.bisect_right(self.lower_bounds, key) - 1
+        if i < 0 or key >= self.upper_bounds[i]:
+            raise ValueError(f"No partition of {self.prefix} for {self.columns[self.partition_index]} = {key}")
+        return i
+
+    def insert(self, data_dict):
+        # psycopg2 does not take empty strings as input, use None instead of ""
+        values = [None if data_dict.get(col) == "" else data_dict.get(col) for col in self.columns]
+        partition = self.route(values)
+
+        sql = f"EXECUTE {self.statements[partition]} ({', '.join(['%s'] * len(values))})"
+        if self.commit_every > 1 and not self.group:
+            sql = "BEGIN; " + sql
+        self.group.append(data_dict)
+        if len(self.group) >= self.commit_every and self.commit_every > 1:
+            sql += "; COMMIT"
+
+        self._execute(sql, values)
+        if len(self.group) >= self.commit_every:
+            self.group = []
+        return partition
+
+    def _execute(self, sql, values=None):
+        try:
+            self.cursor.execute(sql, values)
+        except Exception as e:
+            if self.commit_every == 1:
+                self.group = []
+                raise
+            # A failed statement aborts the whole commit group
+            lost, self.group = self.group, []
+            self.cursor.execute("ROLLBACK")
+            raise GroupCommitError(f"Commit group of {len(lost)} row(s) rolled back: {e}", lost) from e
+
+    def flush(self):
+        """Commit the rows of a partially filled commit group"""
+        if self.group:
+            self._execute("COMMIT")
+            self.group = []
+
+    def close(self):
+        self.flush()
+        for statement in self.statements:
+            self.cursor.execute(f"DEALLOCATE {statement}")
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.group:
+            self.cursor.execute("ROLLBACK")
+            self.group = []
+        self.close()
+
+
+class ShardedPartitions:
+    """Client-side sharding of partitioned tables over several PostgreSQL instances.
+
+    Child table i of a layout lives on node i % len(dsns), as a plain table named
+    <prefix><i>. Placement (node and range bounds per child) is recorded in
+    <prefix>_placement on the first node, which also holds <prefix>_insert_seq for
+    round-robin layouts. Builds read from a data table on a separate source
+    connection; loads and inserts go straight to the owning node and reads are
+    scattered to all nodes in parallel. Several local clusters on different ports
+    are enough to try it out.
+    """
+
+    def __init__(self, dsns):
+        if not dsns:
+            raise ValueError("At least one DSN is required")
+        self.dsns = list(dsns)
+        self.nodes = [psycopg2.connect(dsn) for dsn in self.dsns]
+        self.placements = {}
+
+    def _create_layout(self, partition_table_prefix, strategy, column_to_partition, header_path, bounds):
+        """Create the empty fragments, uncommitted, and return their placement.
+
+        The old layout (every fragment its placement lists, and the placement
+        itself) is dropped and committed first, so a build that fails from here on
+        leaves no placement behind rather than one describing empty or half-loaded
+        fragments, and a rebuild with fewer partitions leaves no stray fragments.
+        _publish_layout records the new placement once every fragment has committed.
+        """
+        with open(header_path, 'r') as f:
+            headers = json.load(f)
+        columns = ', '.join(f"{col} {dtype}" for col, dtype in headers.items())
+
+        with self.nodes[0].cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{partition_table_prefix}_placement",))
+            has_placement = cur.fetchone()[0]
+        self.nodes[0].commit()
+        if has_placement:
+            self.placements.pop(partition_table_prefix, None)
+            old = self.placement(partition_table_prefix)["partitions"]
+        else:
+            old = self.placements.get(partition_table_prefix, {"partitions": []})["partitions"]
+        self.placements.pop(partition_table_prefix, None)
+
+        for p in old:
+            with self.nodes[p["node"]].cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {partition_table_prefix}{p['partition']}")
+        with self.nodes[0].cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {partition_table_prefix}_placement")
+        for connection in self.nodes:
+            connection.commit()
+
+        placement = []
+        for i, (start, end) in enumerate(bounds):
+            node = i % len(self.nodes)
+            check = ""
+            if strategy == "range":
+                check = f", CHECK ({column_to_partition} >= {start} AND {column_to_partition} < {end})"
+            for connection in self.nodes:
+                with connection.cursor() as cur:
+                    cur.execute(f"DROP TABLE IF EXISTS {partition_table_prefix}{i}")
+            with self.nodes[node].cursor() as cur:
+                cur.execute(f"CREATE TABLE {partition_table_prefix}{i} ({columns}{check})")
+            placement.append({"partition": i, "node": node, "lower_bound": start, "upper_bound": end})
+
+        with self.nodes[0].cursor() as cur:
+            cur.execute(f"DROP SEQUENCE IF EXISTS {partition_table_prefix}_insert_seq")
+            if strategy == "round_robin":
+                # Positions start at 0 and the restart value is row count % N, which can be 0
+                cur.execute(f"CREATE SEQUENCE {partition_table_prefix}_insert_seq MINVALUE 0")
+
+        return placement
+
+    def _publish_layout(self, partition_table_prefix, strategy, column_to_partition, placement):
+        with self.nodes[0].cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE {partition_table_prefix}_placement (
+                    partition INTEGER PRIMARY KEY,
+                    node INTEGER NOT NULL,
+                    strategy TEXT NOT NULL,
+                    column_name TEXT,
+                    lower_bound BIGINT,
+                    upper_bound BIGINT
+                )
+            """)
+            for p in placement:
+                cur.execute(
+                    f"INSERT INTO {partition_table_prefix}_placement VALUES (%s, %s, %s, %s, %s, %s)",
+                    (p["partition"], p["node"], strategy, column_to_partition, p["lower_bound"], p["upper_bound"])
+                )
+        self.nodes[0].commit()
+
+        self.placements[partition_table_prefix] = {
+            "strategy": strategy,
+            "column": column_to_partition,
+            "partitions": placement,
+        }
+
+    def _commit_build(self, partition_table_prefix, strategy, column_to_partition, placement):
+        # The first node commits last, so its fragments, the sequence and the
+        # placement are only visible once every other node holds its data
+        for node in self.nodes[1:]:
+            node.commit()
+        self.nodes[0].commit()
+        self._publish_layout(partition_table_prefix, strategy, column_to_partition, placement)
+
+    def placement(self, partition_table_prefix):
+        """Return the cached placement of a layout, reading it from the first node if needed"""
+        if partition_table_prefix not in self.placements:
+            with self.nodes[0].cursor() as cur:
+                cur.execute(f"""
+                    SELECT partition, node, strategy, column_name, lower_bound, upper_bound
+                    FROM {partition_table_prefix}_placement ORDER BY partition
+                """)
+                rows = cur.fetchall()
+            self.nodes[0].commit()
+            self.placements[partition_table_prefix] = {
+                "strategy": rows[0][2],
+                "column": rows[0][3],
+                "partitions": [
+                    {"partition": i, "node": node, "lower_bound": start, "upper_bound": end}
+                    for i, node, _, _, start, end in rows
+                ],
+            }
+        return self.placements[partition_table_prefix]
+
+    def _copy_in(self, partition_table_prefix, i, f, columns=None, options="", node=None):
+        if node is None:
+            node = self.placement(partition_table_prefix)["partitions"][i]["node"]
+        column_list = f" ({', '.join(columns)})" if columns else ""
+        with self.nodes[node].cursor() as cur:
+            cur.copy_expert(f"COPY {partition_table_prefix}{i}{column_list} FROM STDIN {options}", f)
+
+    def range_partition(self, data_table_name, partition_table_prefix, num_partitions, header_path, column_to_partition, connection):
+        """Range partition data_table_name (read through connection) across the nodes"""
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT MIN({column_to_partition}), MAX({column_to_partition}) FROM {data_table_name}")
+        min_val, max_val = cursor.fetchone()
+        interval = math.ceil((max_val - min_val + 1) / num_partitions)
+        bounds = [(min_val + i * interval, min_val + (i + 1) * interval) for i in range(num_partitions)]
+
+        lower_bounds = [start for start, _ in bounds]
+        buffers = [io.BytesIO() for _ in range(num_partitions)]
+        buffered = [0] * num_partitions
+
+        def flush(i):
+            buffers[i].seek(0)
+            self._copy_in(partition_table_prefix, i, buffers[i], node=placement[i]["node"])
+            buffers[i] = io.BytesIO()
+            buffered[i] = 0
+
+        try:
+            placement = self._create_layout(partition_table_prefix, "range", column_to_partition, header_path, bounds)
+            # One scan of the source; the key is dumped as an extra first field so each
+            # COPY text line can be routed without parsing the rest of the row
+            with tempfile.TemporaryFile() as dump:
+                cursor.copy_expert(f"COPY (SELECT {column_to_partition}, * FROM {data_table_name}) TO STDOUT", dump)
+                dump.seek(0)
+                for line in dump:
+                    key, row = line.split(b"\t", 1)
+                    if key == b"\\N":
+                        # The range predicates never matched NULL keys either
+                        continue
+                    i = bisect.bisect_right(lower_bounds, int(key)) - 1
+                    buffers[i].write(row)
+                    buffered[i] += 1
+                    if buffered[i] >= 10000:
+                        flush(i)
+            for i in range(num_partitions):
+                if buffered[i]:
+                    flush(i)
+            self._commit_build(partition_table_prefix, "range", column_to_partition, placement)
+        except Exception:
+            for node in self.nodes:
+                node.rollback()
+            raise
+        finally:
+            connection.commit()
+            cursor.close()
+
+    def round_robin_partition(self, data_table_name, partition_table_prefix, num_partitions, header_path, connection):
+        """Round-robin partition data_table_name (read through connection) across the nodes"""
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {data_table_name}")
+        total_rows = cursor.fetchone()[0]
+        base_count = total_rows // num_partitions
+        remainder = total_rows % num_partitions
+        partition_counts = [base_count + 1 if i < remainder else base_count for i in range(num_partitions)]
+
+        try:
+            placement = self._create_layout(partition_table_prefix, "round_robin", None, header_path,
+                                            [(None, None)] * num_partitions)
+            # COPY text format keeps one row per line, so the sorted dump can be cut by line counts
+            with tempfile.TemporaryFile() as dump:
+                cursor.copy_expert(f"COPY (SELECT * FROM {data_table_name} ORDER BY id) TO STDOUT", dump)
+                dump.seek(0)
+                for i, count in enumerate(partition_counts):
+                    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buf:
+                        for _ in range(count):
+                            buf.write(dump.readline())
+                        buf.seek(0)
+                        self._copy_in(partition_table_prefix, i, buf, node=placement[i]["node"])
+
+            with self.nodes[0].cursor() as cur:
+                cur.execute(f"ALTER SEQUENCE {partition_table_prefix}_insert_seq RESTART WITH {remainder}")
+            self._commit_build(partition_table_prefix, "round_robin", None, placement)
+        except Exception:
+            for node in self.nodes:
+                node.rollback()
+            raise
+        finally:
+            connection.commit()
+            cursor.close()
+
+    def _next_positions(self, partition_table_prefix, n):
+        with self.nodes[0].cursor() as cur:
+            cur.execute(f"SELECT nextval('{partition_table_prefix}_insert_seq') FROM generate_series(1, {n})")
+            positions = [row[0] for row in cur.fetchall()]
+        self.nodes[0].commit()
+        return positions
+
+    def route(self, partition_table_prefix, data_dict, position=None):
+        """Return the child index that owns a row; round-robin rows need their sequence position"""
+        layout = self.placement(partition_table_prefix)
+        partitions = layout["partitions"]
+        if layout["strategy"] == "round_robin":
+            return position % len(partitions)
+
+        key = int(data_dict[layout["column"]])
+        for p in partitions:
+            if p["lower_bound"] <= key < p["upper_bound"]:
+                return p["partition"]
+        raise ValueError(f"No partition of {partition_table_prefix} for {layout['column']} = {key}")
+
+    def insert(self, partition_table_prefix, data_dict):
+        """Insert one row on the node that owns it and return its child index"""
+        position = None
+        if self.placement(partition_table_prefix)["strategy"] == "round_robin":
+            position = self._next_positions(partition_table_prefix, 1)[0]
+        i = self.route(partition_table_prefix, data_dict, position)
+        node = self.nodes[self.placement(partition_table_prefix)["partitions"][i]["node"]]
+
+        # psycopg2 does not take empty strings as input, use None instead of ""
+        values = [None if value == "" else value for value in data_dict.values()]
+        with node.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {partition_table_prefix}{i} ({', '.join(data_dict)}) VALUES ({', '.join(['%s'] * len(values))})",
+                values
+            )
+        node.commit()
+        return i
+
+    def load(self, partition_table_prefix, file_path, batch_rows=10000):
+        """Load a CSV file (with header line) into the layout, routing each row to its owning node"""
+        strategy = self.placement(partition_table_prefix)["strategy"]
+        num_partitions = len(self.placement(partition_table_prefix)["partitions"])
+        buffers = [[] for _ in range(num_partitions)]
+
+        def flush(i):
+            out = io.StringIO()
+            csv.writer(out).writerows(buffers[i])
+            out.seek(0)
+            self._copy_in(partition_table_prefix, i, out, columns=header, options="WITH CSV")
+            buffers[i] = []
+
+        try:
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                positions = []
+                for row in reader:
+                    position = None
+                    if strategy == "round_robin":
+                        if not positions:
+                            positions = self._next_positions(partition_table_prefix, batch_rows)
+                            positions.reverse()
+                        position = positions.pop()
+                    i = self.route(partition_table_prefix, dict(zip(header, row)), position)
+                    buffers[i].append(row)
+                    if len(buffers[i]) >= batch_rows:
+                        flush(i)
+
+            for i in range(num_partitions):
+                if buffers[i]:
+                    flush(i)
+            for node in self.nodes:
+                node.commit()
+        except Exception:
+            for node in self.nodes:
+                node.rollback()
+            raise
+
+    def scatter_gather(self, partition_table_prefix, query, params=None):
+        """Run query on every child in parallel, one thread per node, and return all rows.
+
+        query names the child table as {table}, e.g. "SELECT COUNT(*) FROM {table}".
+        Rows come back in child order.
+        """
+        partitions = self.placement(partition_table_prefix)["partitions"]
+
+        def run_node(node):
+            results = {}
+            with self.nodes[node].cursor() as cur:
+                for p in partitions:
+                    if p["node"] == node:
+                        cur.execute(query.format(table=f"{partition_table_prefix}{p['partition']}"), params)
+                        results[p["partition"]] = cur.fetchall()
+            self.nodes[node].commit()
+            return results
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.nodes)) as pool:
+            per_node = list(pool.map(run_node, range(len(self.nodes))))
+
+        merged = {}
+        for results in per_node:
+            merged.update(results)
+        return [row for i in sorted(merged) for row in merged[i]]
 
+    def close(self):
+        for connection in self.nodes:
+            connection.close()
 
+    def __enter__(self):
+        return self
 
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
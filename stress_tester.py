@@ -0,0 +1,238 @@
+# Import required libraries
+import json
+import math
+import multiprocessing
+import random
+import time
+import traceback
+import psycopg2
+import test_helper
+import assignment4
+
+
+dbname = "assignment4"
+count_of_partitions = 5
+
+# Table nomenclature
+data_table_name = "subreddits"
+column_to_partition = "created_utc"
+range_table_prefix = 'range_part'
+rrobin_table_prefix = 'rrobin_part'
+
+# Data files
+header_path = "./headers.json"
+insert_data_path = "./insert1.json"
+
+# Load shape
+num_writers = 8
+duration_seconds = 30
+sample_interval = 0.1
+# Go through assignment4.PartitionInserter instead of the test_helper insert functions
+use_prepared_inserter = False
+commit_every = 1
+
+# Rows written here are tagged so they can be told apart and cleaned up
+stress_id_prefix = 'stress_'
+
+# Allowed spread between the fullest and emptiest round-robin partition, relative to the mean
+balance_tolerance = 0.01
+
+# What do you want to test:
+build_partitions = False
+range_stress = True
+round_robin_stress = True
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def writer(args):
+    """
+    Insert rows into one layout until the deadline passes
+
+    Returns:
+        latencies (list): Seconds spent on each insert.
+        errors (int): Number of failed inserts.
+    """
+    worker_id, table_name, strategy, key_range, template, deadline = args
+    latencies = []
+    errors = 0
+    rng = random.Random(worker_id)
+
+    conn = test_helper.get_open_connection(dbname=dbname)
+    inserter = None
+    if use_prepared_inserter:
+        inserter = assignment4.PartitionInserter(table_name, header_path, conn, strategy=strategy,
+                                                 column_to_partition=column_to_partition,
+                                                 commit_every=commit_every)
+    try:
+        n = 0
+        while time.time() < deadline:
+            row = dict(template)
+            row["id"] = f"{stress_id_prefix}{worker_id}_{n}"
+            row[column_to_partition] = rng.randint(*key_range)
+            n += 1
+
+            start = time.perf_counter()
+            try:
+                if inserter is not None:
+                    inserter.insert(row)
+                elif strategy == "range":
+                    test_helper.range_insert(table_name, conn, row)
+                else:
+                    test_helper.round_robin_insert(table_name, conn, row)
+            except assignment4.GroupCommitError as e:
+                # The earlier rows of the group were timed as inserted but never committed
+                errors += len(e.rows)
+                del latencies[len(latencies) - (len(e.rows) - 1):]
+                continue
+            except Exception:
+                errors += 1
+                if inserter is None:
+                    conn.rollback()
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        if inserter is not None:
+            try:
+                inserter.close()
+            except assignment4.GroupCommitError as e:
+                errors += len(e.rows)
+                del latencies[len(latencies) - len(e.rows):]
+        conn.close()
+
+    return latencies, errors
+
+
+def sample_lock_waits(cursor):
+    """
+    Get the number of ungranted locks and of backends waiting on a lock right now
+    """
+    cursor.execute(
+        "SELECT COUNT(*) FROM pg_locks l JOIN pg_stat_activity a ON a.pid = l.pid WHERE NOT l.granted AND a.datname = current_database()"
+    )
+    ungranted = int(cursor.fetchone()[0])
+    cursor.execute(
+        "SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database() AND wait_event_type = 'Lock'"
+    )
+    waiting = int(cursor.fetchone()[0])
+    return ungranted, waiting
+
+
+def run_stress(table_name, strategy, key_range, template):
+    """
+    Run num_writers concurrent writers against one layout for duration_seconds and print a report.
+
+    Returns:
+        int: Number of rows inserted successfully.
+    """
+    started = time.time()
+    deadline = started + duration_seconds
+    jobs = [(i, table_name, strategy, key_range, template, deadline) for i in range(num_writers)]
+
+    samples = []
+    with multiprocessing.Pool(num_writers) as pool:
+        pending = pool.map_async(writer, jobs)
+        with test_helper.get_open_connection(dbname=dbname) as monitor:
+            monitor.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with monitor.cursor() as cur:
+                while not pending.ready():
+                    samples.append(sample_lock_waits(cur))
+                    time.sleep(sample_interval)
+        results = pending.get()
+    elapsed = time.time() - started
+
+    latencies = sorted(l for worker_latencies, _ in results for l in worker_latencies)
+    errors = sum(e for _, e in results)
+    inserted = len(latencies)
+
+    print(f"Writers: {num_writers}, duration: {elapsed:.1f}s, inserted: {inserted}, errors: {errors}")
+    print(f"Throughput: {inserted / elapsed:.1f} rows/s")
+    print("Latency (ms): " + ", ".join(
+        f"p{p}={percentile(latencies, p) * 1000:.2f}" for p in (50, 90, 99, 99.9)
+    ) + f", max={(latencies[-1] if latencies else 0) * 1000:.2f}")
+    if samples:
+        waited = sum(1 for _, waiting in samples if waiting)
+        print(f"Lock waits: {waited}/{len(samples)} samples with waiters, "
+              f"max waiting backends={max(w for _, w in samples)}, "
+              f"max ungranted locks={max(u for u, _ in samples)}")
+
+    return inserted
+
+
+def check_round_robin_balance(connection, table_name, n):
+    """
+    Check that the rows written by the stress run are spread evenly over the round-robin partitions.
+
+    Raises:
+        Exception: If the spread is larger than balance_tolerance allows.
+    """
+    count_list = []
+    with connection.cursor() as cur:
+        for i in range(n):
+            cur.execute(f"SELECT COUNT(*) FROM {table_name}{i} WHERE id LIKE '{stress_id_prefix}%'")
+            count_list.append(int(cur.fetchone()[0]))
+
+    print(f"Round robin rows per partition: {count_list}")
+    mean = sum(count_list) / n
+    allowed = max(1, balance_tolerance * mean)
+    if max(count_list) - min(count_list) > allowed:
+        raise Exception(f"Round robin partitions are unbalanced. Spread is {max(count_list) - min(count_list)} rows but at most {allowed:.0f} is allowed")
+
+
+def delete_stress_rows(connection, table_name):
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {table_name} WHERE id LIKE '{stress_id_prefix}%'")
+    connection.commit()
+
+
+def main():
+
+    try:
+        with test_helper.get_open_connection(dbname=dbname) as conn:
+
+            with open(insert_data_path) as json_data:
+                template = json.load(json_data)
+
+            if build_partitions:
+                assignment4.range_partition(data_table_name, range_table_prefix, count_of_partitions, header_path, column_to_partition, conn)
+                assignment4.round_robin_partition(data_table_name, rrobin_table_prefix, count_of_partitions, header_path, conn)
+
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT MIN({column_to_partition}), MAX({column_to_partition}) FROM {data_table_name}")
+                key_range = cur.fetchone()
+
+            if range_stress:
+                print("----------------------------------------------------------------------------")
+                print("Stressing range inserts")
+                delete_stress_rows(conn, range_table_prefix)
+                run_stress(range_table_prefix, "range", key_range, template)
+                delete_stress_rows(conn, range_table_prefix)
+                print("----------------------------------------------------------------------------\n")
+
+            if round_robin_stress:
+                print("----------------------------------------------------------------------------")
+                print("Stressing round robin inserts")
+                delete_stress_rows(conn, rrobin_table_prefix)
+                run_stress(rrobin_table_prefix, "round_robin", key_range, template)
+                try:
+                    check_round_robin_balance(conn, rrobin_table_prefix, count_of_partitions)
+                    print("round robin balance check pass!")
+                except Exception:
+                    traceback.print_exc()
+                delete_stress_rows(conn, rrobin_table_prefix)
+                print("----------------------------------------------------------------------------\n")
+
+    except Exception:
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,12 +3,27 @@ import traceback
 import psycopg2
 import psycopg2.extras
 import csv
+import gzip
+import hashlib
+import os
+import tempfile
 import json
 import math
 
 
 ########################## Setup Functions ##########################
 
+def get_dsn(username='postgres', password='postgres', dbname='postgres', host="127.0.0.1", port=5432):
+    """
+    Build the connection string used by get_open_connection
+
+    Returns:
+        dsn (str): libpq connection string.
+    """
+
+    return f"dbname='{dbname}' user='{username}' host='{host}' port='{port}' password='{password}'"
+
+
 def get_open_connection(username='postgres', password='postgres', dbname='postgres', host="127.0.0.1"):
     """
     Connect to the database and return connection object
@@ -17,7 +32,7 @@ def get_open_connection(username='postgres', password='postgres', dbname='postgr
         connection: The database connection object.
     """
 
-    return psycopg2.connect(f"dbname='{dbname}' user='{username}' host='{host}' password='{password}'")
+    return psycopg2.connect(get_dsn(username, password, dbname, host))
 
 
 def create_db(dbname):
@@ -443,7 +458,7 @@ def test_load_data(my_assignment, table_name, file_path, connection, rows_in_fil
 
 def test_range_partition(my_assignment, data_table_name, partition_table_name, n, 
                          connection, partition_start_index, actual_rows_in_input_file, 
-                         header_file, column_to_partition):
+                         header_file, column_to_partition, **build_options):
     """
     Tests the range partition function.
 
@@ -454,13 +469,14 @@ def test_range_partition(my_assignment, data_table_name, partition_table_name, n
         connection: Connection object for the database.
         partition_start_index (int): Index at which the table names start.
         actual_rows_in_input_file (int): Number of rows in the input file.
+        build_options: Extra keyword arguments for rangePartition (batch_size, resume).
 
     Returns:
         [bool, Exception]: A list containing a boolean value indicating whether the tests passed or failed, and an exception object if the tests failed.
     """
     try:
         # my_assignment.range_partition(table_name, n, connection)
-        my_assignment.range_partition(data_table_name, partition_table_name, n, header_file, column_to_partition, connection)
+        my_assignment.range_partition(data_table_name, partition_table_name, n, header_file, column_to_partition, connection, **build_options)
         test_range_and_robin_partitioning(n, connection, partition_table_name, partition_start_index, actual_rows_in_input_file)
         test_each_range_partition(data_table_name, partition_table_name, n, connection, partition_table_name, column_to_partition)
         return [True, None]
@@ -504,7 +520,7 @@ def test_range_insert(my_assignment, table_name, connection, data_dict, expected
 
 def test_round_robin_partition(my_assignment, data_table_name, partition_table_name, n, 
                          connection, partition_start_index, actual_rows_in_input_file, 
-                         header_file, column_to_partition):
+                         header_file, column_to_partition, **build_options):
     """
     Tests the round robin partitioning.
 
@@ -515,12 +531,13 @@ def test_round_robin_partition(my_assignment, data_table_name, partition_table_n
         connection: Connection object for the database.
         partition_start_index (int): Index at which the table names start.
         actual_rows_in_input_file (int): Number of rows in the input file.
+        build_options: Extra keyword arguments for roundRobinPartition (batch_size, resume, stream, ...).
 
     Returns:
         [bool, Exception]: A list containing a boolean value indicating whether the tests passed or failed, and an exception object if the tests failed.
     """
     try:
-        my_assignment.round_robin_partition(data_table_name, partition_table_name, n, header_file, connection)
+        my_assignment.round_robin_partition(data_table_name, partition_table_name, n, header_file, connection, **build_options)
         test_range_and_robin_partitioning(n, connection, partition_table_name, partition_start_index, actual_rows_in_input_file)
         test_each_round_robin_partition(partition_table_name, n, connection, partition_table_name)
 
@@ -558,3 +575,268 @@ def test_round_robin_insert(my_assignment, table_name, connection, data_dict, ex
             traceback.print_exc()
         return [False, e]
     return [True, None]
+
+
+def test_prepared_insert(my_assignment, table_name, connection, header_path, strategy, column_to_partition, data_dict, expected_table_index, commit_every=1):
+    """
+    Tests the PartitionInserter by inserting one row and checking it landed in the expected table.
+
+    Args:
+        my_assignment: Object containing the PartitionInserter class to be tested.
+        table_name (str): The base name of the table.
+        connection: A connection the inserter may take over (it is switched to autocommit).
+        header_path (str): Path to the header file.
+        strategy (str): "range" or "round_robin".
+        column_to_partition (str): Column the range layout is partitioned on.
+        data_dict (dict): Dictionary containing data
+        expected_table_index (int): The expected table index to which the record has to be saved.
+        commit_every (int): Group commit size, the row is flushed before checking.
+
+    Returns:
+        [bool, Exception]: A list containing a boolean indicating success or failure, and an exception (if any).
+    """
+    try:
+        expected_table_name = f"{table_name}{expected_table_index}"
+        with my_assignment.PartitionInserter(table_name, header_path, connection, strategy=strategy,
+                                             column_to_partition=column_to_partition,
+                                             commit_every=commit_every) as inserter:
+            index = inserter.insert(data_dict)
+            inserter.flush()
+
+        if str(index) != str(expected_table_index):
+            raise Exception(f"Prepared insert routed the tuple to {table_name}{index} instead of {expected_table_name}")
+        if not test_range_robin_insert(expected_table_name, connection, data_dict["id"]):
+            raise Exception(f"Prepared insert failed! Couldn't find tuple in {expected_table_name} table")
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def test_plan_partitions(my_assignment, data_table_name, n, connection, column_to_partition, tolerance=0.05):
+    """
+    Tests the partition planner against the exact per-partition counts.
+
+    Args:
+        my_assignment: Object containing the plan_partitions function to be tested.
+        data_table_name (str): Name of the table to plan for (it gets analyzed first).
+        n (int): Number of partitions.
+        connection: The database connection.
+        column_to_partition (str): The column to range partition on.
+        tolerance (float): Allowed error per partition, as a share of the total row count.
+
+    Returns:
+        [bool, Exception]: A list containing a boolean indicating success or failure, and an exception (if any).
+    """
+    try:
+        with connection.cursor() as cur:
+            cur.execute(f"ANALYZE {data_table_name}")
+        connection.commit()
+
+        count_list = get_count_range_partition(data_table_name, None, n, connection, column_to_partition)
+        total = sum(count_list)
+
+        plan = my_assignment.plan_partitions(data_table_name, column_to_partition, "range", n, connection,
+                                             target_partition_bytes=1024 * 1024)
+        for i in range(n):
+            if abs(plan["rows"][i] - count_list[i]) > tolerance * total:
+                raise Exception(f"Planned {plan['rows'][i]} rows for partition {i} but it holds {count_list[i]}")
+
+        plan = my_assignment.plan_partitions(data_table_name, column_to_partition, "round_robin", n, connection)
+        if abs(sum(plan["rows"]) - total) > tolerance * total:
+            raise Exception(f"Planned {sum(plan['rows'])} rows in total but the table holds {total}")
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def test_export_partitions(my_assignment, table_name, n, connection, dsn, compression="gzip", workers=4):
+    """
+    Tests the partition export by loading every exported file back and comparing row counts.
+
+    Args:
+        my_assignment: Object containing the export_partitions function to be tested.
+        table_name (str): The base name of the partitioned table.
+        n (int): Number of partitions.
+        connection: The database connection.
+        dsn (str): Connection string the export workers connect with.
+        compression (str): Compression passed to export_partitions.
+        workers (int): Number of concurrent export connections.
+
+    Returns:
+        [bool, Exception]: A list containing a boolean indicating success or failure, and an exception (if any).
+    """
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            manifest = my_assignment.export_partitions(table_name, out_dir, dsn, format="csv", workers=workers, compression=compression)
+            if len(manifest["partitions"]) != n:
+                raise Exception(f"Expected {n} exported partitions but the manifest lists {len(manifest['partitions'])}")
+
+            with connection.cursor() as cur:
+                for entry in manifest["partitions"]:
+                    path = os.path.join(out_dir, entry["file"])
+                    with open(path, 'rb') as f:
+                        if hashlib.sha256(f.read()).hexdigest() != entry["sha256"]:
+                            raise Exception(f"Checksum of {entry['file']} does not match the manifest")
+
+                    cur.execute(f"SELECT COUNT(*) FROM {entry['table']}")
+                    count = int(cur.fetchone()[0])
+                    if entry["rows"] != count:
+                        raise Exception(f"Manifest lists {entry['rows']} rows for {entry['table']} but it holds {count}")
+
+                    # Load the file back to make sure it holds exactly those rows
+                    cur.execute(f"CREATE TEMP TABLE export_check (LIKE {entry['table']})")
+                    with (gzip.open(path, 'rb') if compression == "gzip" else open(path, 'rb')) as f:
+                        cur.copy_expert("COPY export_check FROM STDIN WITH (FORMAT csv)", f)
+                    cur.execute("SELECT COUNT(*) FROM export_check")
+                    reloaded = int(cur.fetchone()[0])
+                    cur.execute("DROP TABLE export_check")
+                    if reloaded != count:
+                        raise Exception(f"{entry['file']} loads back {reloaded} rows but {entry['table']} holds {count}")
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+def test_sharded_partition(my_assignment, data_table_name, partition_table_name, n, connection, dsns, header_file, strategy, column_to_partition, data_dict):
+    """
+    Tests sharded partitioning by building a layout across several servers and checking every fragment.
+
+    Args:
+        my_assignment: Object containing the ShardedPartitions class to be tested.
+        data_table_name (str): Name of the table to be partitioned (read through connection).
+        partition_table_name (str): Prefix for the fragments.
+        n (int): Number of partitions.
+        connection: Connection to the database holding data_table_name.
+        dsns (list): Connection strings of the servers to shard over.
+        header_file (str): Path to the header file.
+        strategy (str): "range" or "round_robin".
+        column_to_partition (str): Column the range layout is partitioned on.
+        data_dict (dict): A row to insert through the sharded layout afterwards.
+
+    Returns:
+        [bool, Exception]: A list containing a boolean indicating success or failure, and an exception (if any).
+    """
+    try:
+        with my_assignment.ShardedPartitions(dsns) as shards:
+            if strategy == "range":
+                shards.range_partition(data_table_name, partition_table_name, n, header_file, column_to_partition, connection)
+                count_list = get_count_range_partition(data_table_name, partition_table_name, n, connection, column_to_partition)
+            else:
+                shards.round_robin_partition(data_table_name, partition_table_name, n, header_file, connection)
+                with connection.cursor() as cur:
+                    cur.execute(f"SELECT COUNT(*) FROM {data_table_name}")
+                    total = int(cur.fetchone()[0])
+                count_list = [total // n + (1 if i < total % n else 0) for i in range(n)]
+
+            counts = [int(row[0]) for row in shards.scatter_gather(partition_table_name, "SELECT COUNT(*) FROM {table}")]
+            if counts != count_list:
+                raise Exception(f"Sharded {strategy} fragments hold {counts} rows while the correct numbers are {count_list}")
+
+            nodes = {p["node"] for p in shards.placement(partition_table_name)["partitions"]}
+            if len(nodes) != min(n, len(dsns)):
+                raise Exception(f"Fragments were placed on {len(nodes)} server(s) instead of {min(n, len(dsns))}")
+
+            index = shards.insert(partition_table_name, data_dict)
+            found = [int(row[0]) for row in shards.scatter_gather(partition_table_name, "SELECT COUNT(*) FROM {table} WHERE id = %s", (data_dict["id"],))]
+            if sum(found) != 1 or found[index] != 1:
+                raise Exception(f"Sharded insert failed! Couldn't find exactly one tuple in {partition_table_name}{index}")
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
+
+
+class InterruptedConnection:
+    """
+    Connection wrapper that fails the checkpointed batch number fail_at, as if the build had crashed there.
+    Everything else is passed through to the wrapped connection.
+    """
+
+    def __init__(self, connection, fail_at):
+        self.connection = connection
+        self.fail_at = fail_at
+        self.batches = 0
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.connection.cursor(*args, **kwargs)
+        wrapper = self
+
+        class InterruptedCursor:
+            def __getattr__(self, name):
+                return getattr(cursor, name)
+
+            def execute(self, query, vars=None):
+                # Each checkpointed batch is one statement that also updates the checkpoint
+                if "progress AS (" in query:
+                    wrapper.batches += 1
+                    if wrapper.batches == wrapper.fail_at:
+                        raise Exception("Simulated crash")
+                return cursor.execute(query, vars)
+
+        return InterruptedCursor()
+
+
+def test_resume_partition(my_assignment, data_table_name, partition_table_name, n, connection, actual_rows_in_input_file, header_file, strategy, column_to_partition, batch_size):
+    """
+    Tests resuming a checkpointed build: the build is interrupted after a few committed batches,
+    then resumed, and every partition has to end up with exactly the right rows.
+
+    Args:
+        my_assignment: Object containing the partition functions to be tested.
+        data_table_name (str): Name of table to be partitioned.
+        partition_table_name (str): Prefix for the partition tables.
+        n (int): Number of partitions.
+        connection: The database connection.
+        actual_rows_in_input_file (int): Number of rows in the input file.
+        header_file (str): Path to the header file.
+        strategy (str): "range" or "round_robin".
+        column_to_partition (str): Column the range layout is partitioned on.
+        batch_size (int): Rows per checkpointed batch, small enough for several batches.
+
+    Returns:
+        [bool, Exception]: A list containing a boolean indicating success or failure, and an exception (if any).
+    """
+    def build(conn, **build_options):
+        if strategy == "range":
+            my_assignment.range_partition(data_table_name, partition_table_name, n, header_file, column_to_partition, conn, batch_size=batch_size, **build_options)
+        else:
+            my_assignment.round_robin_partition(data_table_name, partition_table_name, n, header_file, conn, batch_size=batch_size, **build_options)
+
+    try:
+        try:
+            build(InterruptedConnection(connection, fail_at=3))
+            raise Exception("The interrupted build did not fail")
+        except Exception as e:
+            if str(e) != "Simulated crash":
+                raise
+
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT next_page, rows_copied FROM {partition_table_name}_checkpoint")
+            next_page, rows_copied = cur.fetchone()
+            if next_page == 0 or rows_copied == 0:
+                raise Exception(f"Expected a partial checkpoint, found next_page={next_page}, rows_copied={rows_copied}")
+            cur.execute(f"SELECT COUNT(*) FROM {partition_table_name}")
+            count = int(cur.fetchone()[0])
+            if count != rows_copied:
+                raise Exception(f"Checkpoint records {rows_copied} copied rows but {partition_table_name} holds {count}")
+        connection.commit()
+
+        build(connection, resume=True)
+
+        test_range_and_robin_partitioning(n, connection, partition_table_name, 0, actual_rows_in_input_file)
+        if strategy == "range":
+            test_each_range_partition(data_table_name, partition_table_name, n, connection, partition_table_name, column_to_partition)
+        else:
+            test_each_round_robin_partition(partition_table_name, n, connection, partition_table_name)
+    except Exception as e:
+        traceback.print_exc()
+        return [False, e]
+    return [True, None]
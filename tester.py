@@ -30,6 +30,14 @@ rows_in_input = 914067
 load_data = True
 range_partion = True
 round_robin_partition = True
+prepared_insert = True
+plan_partitions = True
+checkpointed_partition = True
+export_partitions = True
+stream_partition = True
+# Needs a second server with the same database, e.g. another local cluster on port 5433
+sharded_partition = False
+shard_ports = [5432, 5433]
 
 
 def main():
@@ -63,6 +71,15 @@ def main():
             with open(insert_data_path_3) as json_data:
                 data_dict_3 = json.load(json_data)
             
+            if plan_partitions:
+                # Test the dry-run planner against the exact counts
+                print("----------------------------------------------------------------------------")
+                print("Testing plan_partitions function")
+                [result, e] = test_helper.test_plan_partitions(assignment4, data_table_name, count_of_partitions, conn, column_to_partition)
+                if result:
+                    print("plan_partitions function pass!")
+                print("----------------------------------------------------------------------------\n")
+
             if range_partion:
                 # Test the range partition function
                 print("----------------------------------------------------------------------------")
@@ -103,6 +120,73 @@ def main():
                     print("round_robin_insert function pass!")
                 print("----------------------------------------------------------------------------\n")
 
+            if prepared_insert:
+                # Test the prepared statement inserter on its own connection
+                # Expects the range and round robin tables and inserts above to have run
+                print("----------------------------------------------------------------------------")
+                print("Testing PartitionInserter")
+                with test_helper.get_open_connection(dbname=dbname) as inserter_conn:
+                    [result, e] = test_helper.test_prepared_insert(assignment4, range_table_prefix, inserter_conn, header_path, "range", column_to_partition, dict(data_dict_1, id="t1511p", created_utc=str(data_dict_1["created_utc"])), '0')
+                    if result:
+                        [result, e] = test_helper.test_prepared_insert(assignment4, rrobin_table_prefix, inserter_conn, header_path, "round_robin", column_to_partition, dict(data_dict_2, id="t1512p"), str((rows_in_input + 3) % 5), commit_every=10)
+                if result:
+                    print("PartitionInserter pass!")
+                print("----------------------------------------------------------------------------\n")
+
+            if checkpointed_partition:
+                # Rebuild both layouts in committed, checkpointed batches
+                # resume=True without a leftover checkpoint has to fall back to a full build
+                print("----------------------------------------------------------------------------")
+                print("Testing checkpointed range_partition and round_robin_partition")
+                [result, e] = test_helper.test_range_partition(assignment4, data_table_name, range_table_prefix, count_of_partitions, conn, 0, rows_in_input, header_path, column_to_partition, batch_size=50000)
+                if result:
+                    [result, e] = test_helper.test_round_robin_partition(assignment4, data_table_name, rrobin_table_prefix, count_of_partitions, conn, 0, rows_in_input, header_path, column_to_partition, batch_size=50000)
+                if result:
+                    [result, e] = test_helper.test_round_robin_partition(assignment4, data_table_name, rrobin_table_prefix, count_of_partitions, conn, 0, rows_in_input, header_path, column_to_partition, batch_size=50000, resume=True)
+                if result:
+                    # Interrupt a build after two committed batches and resume it from the checkpoint
+                    [result, e] = test_helper.test_resume_partition(assignment4, data_table_name, range_table_prefix, count_of_partitions, conn, rows_in_input, header_path, "range", column_to_partition, batch_size=50000)
+                if result:
+                    [result, e] = test_helper.test_resume_partition(assignment4, data_table_name, rrobin_table_prefix, count_of_partitions, conn, rows_in_input, header_path, "round_robin", column_to_partition, batch_size=50000)
+                if result:
+                    print("checkpointed partitioning pass!")
+                print("----------------------------------------------------------------------------\n")
+
+            if stream_partition:
+                # Rebuild the round robin layout through a server-side cursor, once per ordering
+                print("----------------------------------------------------------------------------")
+                print("Testing streamed round_robin_partition")
+                for order_by in ("id", "ctid", None):
+                    [result, e] = test_helper.test_round_robin_partition(assignment4, data_table_name, rrobin_table_prefix, count_of_partitions, conn, 0, rows_in_input, header_path, column_to_partition, stream=True, order_by=order_by)
+                    if not result:
+                        break
+                if result:
+                    print("streamed round_robin_partition pass!")
+                print("----------------------------------------------------------------------------\n")
+
+            if export_partitions:
+                # Export every range and round robin fragment and load it back
+                print("----------------------------------------------------------------------------")
+                print("Testing export_partitions function")
+                [result, e] = test_helper.test_export_partitions(assignment4, range_table_prefix, count_of_partitions, conn, test_helper.get_dsn(dbname=dbname))
+                if result:
+                    [result, e] = test_helper.test_export_partitions(assignment4, rrobin_table_prefix, count_of_partitions, conn, test_helper.get_dsn(dbname=dbname), compression=None)
+                if result:
+                    print("export_partitions function pass!")
+                print("----------------------------------------------------------------------------\n")
+
+            if sharded_partition:
+                # Build both layouts across the shard servers and route one insert each
+                print("----------------------------------------------------------------------------")
+                print("Testing ShardedPartitions")
+                shard_dsns = [test_helper.get_dsn(dbname=dbname, port=port) for port in shard_ports]
+                [result, e] = test_helper.test_sharded_partition(assignment4, data_table_name, 'range_shard', count_of_partitions, conn, shard_dsns, header_path, "range", column_to_partition, dict(data_dict_1, id="t1511s"))
+                if result:
+                    [result, e] = test_helper.test_sharded_partition(assignment4, data_table_name, 'rrobin_shard', count_of_partitions, conn, shard_dsns, header_path, "round_robin", column_to_partition, dict(data_dict_2, id="t1512s"))
+                if result:
+                    print("ShardedPartitions pass!")
+                print("----------------------------------------------------------------------------\n")
+
             # Delete or not? I say yay, but your opinion might differ
             choice = input('Press d to Delete all tables? ')
             if (choice == 'd'):